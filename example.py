@@ -5,8 +5,8 @@ from phonon.fields import *
 from phonon.model import Model
 
 class Foo(Model):
-    a = SumField()
+    a = Sum()
 
-foo = Foo(a=1)
-print Foo._fields
-print foo.a
+foo = Foo(id=1, a=1)
+print(Foo._fields)
+print(foo.a)
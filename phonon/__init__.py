@@ -8,14 +8,16 @@ TTL = 30 * 60
 SYSLOG_LEVEL = logging.WARNING
 
 
+FORMATTER = logging.Formatter(fmt='PHONON %(levelname)s - ( %(pathname)s ):%(funcName)s:L%(lineno)d %(message)s')
+
+
 def get_logger(name, log_level=SYSLOG_LEVEL):
     l = logging.getLogger(name)
 
-    formatter = logging.Formatter(fmt='PHONON %(levelname)s - ( %(pathname)s ):%(funcName)s:L%(lineno)d %(message)s')
-    handler = logging.StreamHandler(sys.stdout)
-    handler.setFormatter(formatter)
-
-    l.addHandler(handler)
+    if not l.handlers:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(FORMATTER)
+        l.addHandler(handler)
     l.propagate = True
     l.setLevel(log_level)
 
@@ -27,4 +29,6 @@ def get_ms():
 
 
 def s_to_ms(s):
+    if isinstance(s, int):
+        return s * 1000
     return int(s * 1000.)
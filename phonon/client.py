@@ -1,21 +1,35 @@
 import redis
+import socket
 import zlib
 
 from phonon import get_logger
+import phonon.exceptions
 
 logger = get_logger(__name__)
 
 connection = None
 
+SOCKET_KEEPALIVE_OPTIONS = {getattr(socket, option): value
+                            for option, value in (('TCP_KEEPIDLE', 60), ('TCP_KEEPINTVL', 10), ('TCP_KEEPCNT', 3))
+                            if hasattr(socket, option)}
+
 
 class ShardedClient(object):
 
-    def __init__(self, hosts=None, port=6379, db=0):
+    MAX_CONNECTIONS = 32
+
+    def __init__(self, hosts=None, port=6379, db=0, max_connections=MAX_CONNECTIONS):
         self.hosts = sorted(hosts)
-        self.clients = [redis.StrictRedis(host=host, port=port, db=db) for host in self.hosts]
+        self.clients = [redis.StrictRedis(connection_pool=redis.BlockingConnectionPool(
+            host=host, port=port, db=db,
+            max_connections=max_connections,
+            socket_keepalive=True,
+            socket_keepalive_options=SOCKET_KEEPALIVE_OPTIONS)) for host in self.hosts]
+        self.shard_count = len(self.clients)
+        self.scripts = {}
 
     def route(self, key):
-        return self.clients[(zlib.crc32(key) & 0xffffffff) % len(self.clients)]
+        return self.clients[(zlib.crc32(key) & 0xffffffff) % self.shard_count]
 
     def __flushall(self):
         return all([client.flushall() for client in self.clients])
@@ -29,14 +43,88 @@ class ShardedClient(object):
         if method == 'flushdb':
             return self.__flushdb
 
+        clients, route = self.clients, self.route
+
         def wrap(*args, **kwargs):
             if not args:
-                return [getattr(client, method)(*args, **kwargs) for client in self.clients]
+                return [getattr(client, method)(*args, **kwargs) for client in clients]
 
-            client = self.route(args[0])
-            return getattr(client, method)(*args, **kwargs)
+            return getattr(route(args[0]), method)(*args, **kwargs)
 
+        # Cache the wrapper on the instance so later lookups skip __getattr__.
+        if hasattr(redis.StrictRedis, method):
+            setattr(self, method, wrap)
         return wrap
 
     def using_key(self, key):
         return self.route(key)
+
+    def pipeline(self, transaction=False):
+        return ShardedPipeline(self, transaction=transaction)
+
+    def register_script(self, script):
+        """
+        Registers a lua script once per client. Calling the returned function evaluates the script via EVALSHA on
+        the shard owning the first key, loading it onto that shard the first time it's missing.
+
+        :param str script: The lua source of the script.
+        :returns: A function accepting a non-empty `keys` list and an optional `args` list.
+        """
+        if script not in self.scripts:
+            registered = self.clients[0].register_script(script)
+
+            def call(keys, args=None):
+                if not keys:
+                    raise phonon.exceptions.ArgumentError("Scripts are routed by their first key; keys can't be empty")
+                return registered(keys=keys, args=args or [], client=self.route(keys[0]))
+
+            self.scripts[script] = call
+
+        return self.scripts[script]
+
+
+class ShardedPipeline(object):
+    """
+    Buffers commands in one pipeline per shard, routed by their first argument, and flushes each shard once on
+    execute. Results are returned in the order the commands were issued.
+    """
+
+    def __init__(self, sharded_client, transaction=False):
+        self.sharded_client = sharded_client
+        self.transaction = transaction
+        self.pipelines = {}
+        self.commands = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.reset()
+
+    def __len__(self):
+        return len(self.commands)
+
+    def __getattr__(self, method):
+        def wrap(*args, **kwargs):
+            client = self.sharded_client.route(args[0])
+            if client not in self.pipelines:
+                self.pipelines[client] = client.pipeline(transaction=self.transaction)
+            pipeline = self.pipelines[client]
+            getattr(pipeline, method)(*args, **kwargs)
+            self.commands.append((client, len(pipeline) - 1))
+            return self
+
+        return wrap
+
+    def execute(self, raise_on_error=True):
+        results = {client: pipeline.execute(raise_on_error=raise_on_error)
+                   for client, pipeline in self.pipelines.items()}
+        rvalues = [results[client][index] for client, index in self.commands]
+        self.reset()
+        return rvalues
+
+    def reset(self):
+        for pipeline in self.pipelines.values():
+            pipeline.reset()
+        self.pipelines = {}
+        self.commands = []
@@ -1,10 +1,7 @@
-import time
-
 import uuid
 import tornado.ioloop
-import collections
 
-from phonon import get_logger, PHONON_NAMESPACE
+from phonon import get_logger, get_ms, s_to_ms
 import phonon.client
 import phonon.event
 
@@ -12,25 +9,36 @@ import phonon.event
 logger = get_logger(__name__)
 connection = None
 
-
-def get_ms():
-    return int(time.time() * 1000.)
-
-
-def s_to_ms(s):
-    return int(s * 1000.)
+# KEYS[1]: heartbeat key, ARGV[1]: connection id, ARGV[2]: now (ms),
+# ARGV[3]: failure threshold (ms). Returns {failed pids, active pids}.
+HEARTBEAT_SCRIPT = """
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+local cutoff = tonumber(ARGV[2]) - tonumber(ARGV[3])
+local heartbeats = redis.call('HGETALL', KEYS[1])
+local failed = {}
+local active = {}
+for i = 1, #heartbeats, 2 do
+    if tonumber(heartbeats[i + 1]) <= cutoff then
+        failed[#failed + 1] = heartbeats[i]
+    else
+        active[#active + 1] = heartbeats[i]
+    end
+end
+return {failed, active}
+"""
 
 
 class AsyncConn(phonon.event.EventMixin):
 
     HEARTBEAT_INTERVAL = 30  # Seconds
     HEARTBEAT_KEY = '{}.heartbeat'.format(phonon.PHONON_NAMESPACE)
+    REGISTRY_KEY_PREFIX = '{}_'.format(phonon.PHONON_NAMESPACE)
     PROCESS_TTL = phonon.TTL * 0.5
 
     def __init__(self, redis_hosts, port=6379, db=1, ioloop=None):
         super(AsyncConn, self).__init__()
 
-        self.id = str(uuid.uuid4())
+        self.id = uuid.uuid4().hex
 
         self.client = phonon.client.ShardedClient(
             hosts=redis_hosts, port=port, db=db)
@@ -48,68 +56,97 @@ class AsyncConn(phonon.event.EventMixin):
         )
         self.registry_key = self.get_registry_key(self.id)
         self.local_registry = set()
+        self.closed = False
 
         self.heart.start()
         self.ioloop.add_callback(self.send_heartbeat)
 
     def get_registry_key(self, id):
-        return "{}_{}.registry".format(PHONON_NAMESPACE, id)
+        return self.REGISTRY_KEY_PREFIX + id + ".registry"
 
     def send_heartbeat(self):
-        self.client.hset(self.HEARTBEAT_KEY, self.id, get_ms())
-        self.recover_failed_processes()
+        heartbeat = self.client.register_script(HEARTBEAT_SCRIPT)
+        failed, active = heartbeat(keys=[self.HEARTBEAT_KEY],
+                                   args=[self.id, get_ms(), s_to_ms(3 * self.HEARTBEAT_INTERVAL)])
+        self.recover_failed_processes(set(failed), set(active))
         self.trigger(phonon.event.HEARTBEAT)
 
     def get_registry(self):
         return self.client.smembers(self.registry_key)
 
-    def add_to_registry(self, member, registry_key=None):
+    def add_to_registry(self, member, registry_key=None, pipeline=None):
         self.local_registry.add(member)
-        return self.client.sadd(registry_key or self.registry_key, member)
+        client = self.client if pipeline is None else pipeline
+        return client.sadd(registry_key or self.registry_key, member)
 
-    def remove_from_registry(self, member):
+    def remove_from_registry(self, member, pipeline=None):
         if member in self.local_registry:  # force_expiry can cause this to be called twice.
             self.local_registry.remove(member)
-        return self.client.srem(self.registry_key, member)
+        client = self.client if pipeline is None else pipeline
+        return client.srem(self.registry_key, member)
 
     def move_n_to_new_registry(self, old_registry, new_registry, n=0):
         if not n:
             return
         members = self.client.srandmember(old_registry, n)
-        for member in members:
-            self.client.sadd(new_registry, member)
-            self.client.srem(old_registry, member)
+        if not members:
+            return
+        pipeline = self.client.pipeline()
+        pipeline.sadd(new_registry, *members)
+        pipeline.srem(old_registry, *members)
+        pipeline.execute()
 
     def list_failed_and_active_pids(self):
-        failed = set()
-        active = set()
-        for pid, heartbeat_time in self.client.hgetall(self.HEARTBEAT_KEY).items():
-            if int(heartbeat_time) <= get_ms() - s_to_ms(3 * self.HEARTBEAT_INTERVAL):
-                failed.add(pid)
-            else:
-                active.add(pid)
-        return failed, active
-
-    def recover_failed_processes(self):
-        failed, active = self.list_failed_and_active_pids()
+        heartbeats = self.client.hgetall(self.HEARTBEAT_KEY)
+        cutoff = get_ms() - s_to_ms(3 * self.HEARTBEAT_INTERVAL)
+        failed = set(pid for pid, heartbeat_time in heartbeats.items()
+                     if int(heartbeat_time) <= cutoff)
+        return failed, set(heartbeats) - failed
+
+    def recover_failed_processes(self, failed=None, active=None):
+        """
+        Each failed process is claimed by exactly one active process,
+        picked by its position among the sorted active pids, so that
+        processes don't race each other for the same orphaned registry.
+        """
+        if failed is None:
+            failed, active = self.list_failed_and_active_pids()
+
         if failed:
-            logger.warning("Recovering {} failed processes!".format(len(failed)))
-
-        for failed_pid in failed:
-            registry_key = self.get_registry_key(failed_pid)
-            if failed_pid == self.id:
-                self.id = unicode(uuid.uuid4())
-                self.registry_key = self.get_registry_key(self.id)
-            elif active:
-                orphan_count = self.client.scard(registry_key)
-                claim_count = int(orphan_count / len(active)) or 1
-                self.move_n_to_new_registry(registry_key, self.registry_key, claim_count)
-                if claim_count == orphan_count:
-                    self.client.hdel(self.HEARTBEAT_KEY, failed_pid)
-            else:
+            logger.warning("Recovering %s failed processes!", len(failed))
+
+        if self.id in failed:
+            self.id = uuid.uuid4().hex
+            self.registry_key = self.get_registry_key(self.id)
+            return
+
+        if not active:
+            if failed:
                 logger.error("There are no active processes to recover failed processes.")
+            return
+
+        active = sorted(active)
+        if self.id not in active:
+            return
+
+        index, active_count = active.index(self.id), len(active)
+        claimed = [pid for i, pid in enumerate(sorted(failed)) if i % active_count == index]
+        if not claimed:
+            return
+
+        with self.client.pipeline() as pipeline:
+            for failed_pid in claimed:
+                pipeline.scard(self.get_registry_key(failed_pid))
+            orphan_counts = pipeline.execute()
+
+        for failed_pid, orphan_count in zip(claimed, orphan_counts):
+            self.move_n_to_new_registry(self.get_registry_key(failed_pid), self.registry_key, orphan_count)
+            self.client.hdel(self.HEARTBEAT_KEY, failed_pid)
 
     def close(self):
+        if self.closed:
+            return
+        self.closed = True
         self.heart.stop()
         self.client.hdel(self.HEARTBEAT_KEY, self.id)
         self.local_registry = set()
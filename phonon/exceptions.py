@@ -10,5 +10,9 @@ class ArgumentError(PhononError):
     pass
 
 
+class CacheError(PhononError):
+    pass
+
+
 class NotImplementedError(PhononError):
     pass
@@ -80,7 +80,7 @@ class ListAppend(Field):
 
     def cache(self, client, model, field_name, field_value):
         key = self.key(model.name(), model.id, field_name)
-        return client.rpush(key, *field_value) > 0
+        return client.rpush(key, *field_value) is not None
 
     def merge(self, a, b):
         return a + b
@@ -94,7 +94,7 @@ class SetAppend(Field):
 
     def cache(self, client, model, field_name, field_value):
         key = self.key(model.name(), model.id, field_name)
-        return client.sadd(key, *field_value) > 0
+        return client.sadd(key, *field_value) is not None
 
     def merge(self, a, b):
         return a.union(b)
@@ -1,26 +1,64 @@
 import time
+import random
 
 import phonon
 import phonon.connections
 import phonon.exceptions
 
+# KEYS[1]: lock key, ARGV[1]: connection id, ARGV[2]: ttl (ms)
+ACQUIRE_SCRIPT = """
+if redis.call('SET', KEYS[1], ARGV[1], 'NX', 'PX', ARGV[2]) then
+    return 1
+end
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    redis.call('PEXPIRE', KEYS[1], ARGV[2])
+    return 1
+end
+return 0
+"""
+
+# KEYS[1]: lock key, ARGV[1]: connection id
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
 
 class Lock(object):
 
-    def __init__(self, resource_key):
+    BASE_RETRY = 0.005  # Seconds
+    MAX_RETRY = 0.5  # Seconds
+    JITTER = 0.5
+    TIMEOUT = 500  # Seconds
+
+    def __init__(self, resource_key, block=False, timeout=None):
+        """
+        :param str resource_key: The key of the resource to lock.
+        :param bool block: Whether to retry, with exponential backoff and jitter, while another connection holds
+            the lock instead of raising AlreadyLocked immediately.
+        :param float timeout: The number of seconds to keep retrying for when blocking. Defaults to Lock.TIMEOUT.
+        """
         self.lock_key = "{}.lock".format(resource_key)
         self.conn = phonon.connections.connection
+        self.block = block
+        self.timeout = self.TIMEOUT if timeout is None else timeout
 
     def __enter__(self):
-        acquired = self.conn.client.setnx(self.lock_key, self.conn.id)
-        if not acquired:
-            connection_id = self.conn.client.get(self.lock_key)
-            if connection_id == self.conn.id:
-                self.conn.client.pexpire(self.lock_key, phonon.TTL)
-            else:
+        acquire = self.conn.client.register_script(ACQUIRE_SCRIPT)
+        deadline = time.time() + self.timeout
+        attempt = 0
+        while not acquire(keys=[self.lock_key], args=[self.conn.id, phonon.s_to_ms(phonon.TTL)]):
+            remaining = deadline - time.time()
+            if not self.block or remaining <= 0:
                 raise phonon.exceptions.AlreadyLocked("Already locked")
-        else:
-            self.conn.client.pexpire(self.lock_key, phonon.TTL)
+            delay = self.BASE_RETRY * (2 ** attempt) * random.uniform(1 - self.JITTER, 1 + self.JITTER)
+            time.sleep(min(delay, self.MAX_RETRY, remaining))
+            # Stop growing once the backoff is capped so 2 ** attempt can't overflow a float.
+            if self.BASE_RETRY * (2 ** attempt) < self.MAX_RETRY:
+                attempt += 1
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self.conn.client.delete(self.lock_key)
+        release = self.conn.client.register_script(RELEASE_SCRIPT)
+        release(keys=[self.lock_key], args=[self.conn.id])
@@ -57,8 +57,7 @@ class Model(object):
             self.id = kwargs['id']
             self.__resource_key = "{}.{}".format(self.__class__.__name__, self.id)
             self.reference = phonon.reference.Reference(self.__resource_key)
-            self.__client = phonon.connections.connection.client.using_key(self.__resource_key)
-        except KeyError, e:
+        except KeyError:
             raise phonon.exceptions.ArgumentError("id is a required field")
 
         for key, field in self.__class__._fields.items():
@@ -68,7 +67,7 @@ class Model(object):
         return self.__class__.__name__
 
     def registry_key(self):
-        return "{}.{}".format(self.name(), self.id)
+        return self.__resource_key
 
     def merge(self, other):
         for key, field in self.__class__._fields.items():
@@ -76,10 +75,20 @@ class Model(object):
                                            getattr(other, key)))
 
     def cache(self):
+        """
+        Caches every field in a single pipeline, flushed once per shard, raising a CacheError naming the first field
+        any of whose commands failed.
+        """
+        pipeline = phonon.connections.connection.client.pipeline()
+        field_names = []
         for field_name, field in self.__class__._fields.items():
-            field_value = getattr(self, field_name)
-            if not field.cache(self.__client, self, field_name, field_value):
+            queued = len(pipeline)
+            field.cache(pipeline, self, field_name, getattr(self, field_name))
+            field_names.extend([field_name] * (len(pipeline) - queued))
+
+        for field_name, result in zip(field_names, pipeline.execute(raise_on_error=False)):
+            if result is None or isinstance(result, Exception):
                 raise phonon.exceptions.CacheError("Failed to cache {}".format(field_name))
 
     def on_complete(self):
-        raise phonon.exceptions.NotImplemented("on_complete should be implemented.")
+        raise phonon.exceptions.NotImplementedError("on_complete should be implemented.")
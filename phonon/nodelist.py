@@ -1,8 +1,29 @@
-import time
-
-import phonon.client
 import phonon.connections
-from phonon import PHONON_NAMESPACE
+from phonon import PHONON_NAMESPACE, get_ms, s_to_ms
+
+# Drops nodes whose session was last refreshed before now - expiration delta. Keep the comparison in line with
+# Nodelist.find_expired_nodes.
+PRUNE_EXPIRED_NODES = """
+local nodes = redis.call('HGETALL', KEYS[1])
+local cutoff = tonumber(ARGV[2]) - tonumber(ARGV[3])
+for i = 1, #nodes, 2 do
+    if tonumber(nodes[i + 1]) < cutoff then
+        redis.call('HDEL', KEYS[1], nodes[i])
+    end
+end
+"""
+
+# KEYS[1]: nodelist key, ARGV[1]: node id, ARGV[2]: now (ms), ARGV[3]: expiration delta (ms)
+REFRESH_SESSION_SCRIPT = PRUNE_EXPIRED_NODES + """
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+return redis.call('HLEN', KEYS[1])
+"""
+
+# KEYS[1]: nodelist key, ARGV[1]: node id, ARGV[2]: now (ms), ARGV[3]: expiration delta (ms)
+REMOVE_NODE_SCRIPT = PRUNE_EXPIRED_NODES + """
+redis.call('HDEL', KEYS[1], ARGV[1])
+return redis.call('HLEN', KEYS[1])
+"""
 
 
 class Nodelist(object):
@@ -12,30 +33,55 @@ class Nodelist(object):
     session was last refreshed.
     """
 
-    def __init__(self, resource_key):
+    __slots__ = ('resource_key', 'nodelist_key', 'conn')
+
+    def __init__(self, resource_key, pipeline=None):
         """
-        :param phonon.connections.AsyncConn conn: The Process to which the instantiating
-            reference belongs
         :param string resource_key: An identifier for the instantiating
             reference
+        :param phonon.client.ShardedPipeline pipeline: optional, a pipeline to
+            queue the initial session refresh on instead of sending it
+            immediately
         """
         self.resource_key = resource_key
         self.nodelist_key = "{0}_{1}.nodelist".format(PHONON_NAMESPACE, resource_key)
         self.conn = phonon.connections.connection
-        self.refresh_session()
+        self.refresh_session(pipeline=pipeline)
 
-    def refresh_session(self, node_id=None):
+    def refresh_session(self, node_id=None, pipeline=None):
         """
         Adds or refreshes a particular node in the nodelist, attributing the
         current time with the node_id.
 
         :param string node_id: optional, the connection id of the node whose
         session should be refreshed
+        :param phonon.client.ShardedPipeline pipeline: optional, a pipeline to
+            queue the write on instead of sending it immediately
         """
         if not node_id:
             node_id = self.conn.id
 
-        self.conn.client.hset(self.nodelist_key, node_id, int(time.time() * 1000.))
+        client = self.conn.client if pipeline is None else pipeline
+        client.hset(self.nodelist_key, node_id, get_ms())
+
+    def refresh_session_and_remove_expired_nodes(self, node_id=None):
+        """
+        Removes all expired nodes from the nodelist and refreshes a particular
+        node in a single round trip. The work is done atomically by a lua
+        script on the server, so no lock is required.
+
+        :param string node_id: optional, the connection id of the node whose
+        session should be refreshed
+
+        :rtype: int
+        :returns: The number of nodes in the nodelist afterwards
+        """
+        if not node_id:
+            node_id = self.conn.id
+
+        refresh = self.conn.client.register_script(REFRESH_SESSION_SCRIPT)
+        return refresh(keys=[self.nodelist_key],
+                       args=[node_id, get_ms(), s_to_ms(self.conn.PROCESS_TTL)])
 
     def find_expired_nodes(self, node_ids=None):
         """
@@ -45,16 +91,16 @@ class Nodelist(object):
 
         :param list node_ids: optional, a list of ids to check to see if they
             have expired.  If node_ids is not passed in, all nodes in the hash
-            will be checked.
+            will be checked. Ids no longer in the hash are ignored.
         """
         if node_ids:
-            nodes = zip(node_ids, [int(t) for t in self.conn.client.hmget(self.nodelist_key, node_ids)])
+            nodes = zip(node_ids, self.conn.client.hmget(self.nodelist_key, node_ids))
         else:
-            nodes = self.get_all_nodes().items()
+            nodes = self.conn.client.hgetall(self.nodelist_key).items()
 
-        expiration_delta = self.conn.PROCESS_TTL * 1000.
-        now = int(time.time() * 1000.)
-        return [node_id for (node_id, last_updated) in nodes if (now - last_updated) > expiration_delta]
+        cutoff = get_ms() - s_to_ms(self.conn.PROCESS_TTL)
+        return [node_id for (node_id, last_updated) in nodes
+                if last_updated is not None and int(last_updated) < cutoff]
 
     def remove_expired_nodes(self, node_ids=None):
         """
@@ -83,6 +129,24 @@ class Nodelist(object):
 
         self.conn.client.hdel(self.nodelist_key, node_id)
 
+    def remove_node_and_expired_nodes(self, node_id=None):
+        """
+        Removes a particular node along with all expired nodes from the
+        nodelist in a single round trip. The work is done atomically by a lua
+        script on the server, so no lock is required.
+
+        :param string node_id: optional, the process id of the node to remove
+
+        :rtype: int
+        :returns: The number of nodes in the nodelist afterwards
+        """
+        if not node_id:
+            node_id = self.conn.id
+
+        remove = self.conn.client.register_script(REMOVE_NODE_SCRIPT)
+        return remove(keys=[self.nodelist_key],
+                      args=[node_id, get_ms(), s_to_ms(self.conn.PROCESS_TTL)])
+
     def clear_nodelist(self):
         """
         Removes all nodes from a nodelist.
@@ -1,7 +1,5 @@
 from phonon import get_logger, PHONON_NAMESPACE, TTL
 
-import time
-
 import phonon.lock
 import phonon.nodelist
 import phonon.connections
@@ -22,75 +20,93 @@ class Reference(object):
 
     More in-depth:
 
-    When a process acquires a `Reference` to a resource it attempts to lock
-    that resource. It will block by default for a total of Process.BLOCKING_TIMEOUT
-    seconds (defaults to 500s) before raising a Reference.AlreadyLocked
-    exception
-
-    That process/reference will attempt to connect to the backend, and retry
-    until either successful completion of the task or python's maximum
-    recursion depth has been reached (100 retries), sleeping
-    Process.RETRY_SLEEP seconds between each retry (defaults to 0.5s).
-
-    Upon successfully locking; `Reference` will create a record with the key
-    "{0}.reflist".format(pid) in redis where the key is the unique id for the
-    process this code is running on and the value is the unix timestamp for the
-    time the process last modified that entry. If a pid is in that list it is
-    assumed they currently have an active session for whatever resource is
-    locked. If the record was created longer ago than the session length it is
-    assumed the process "fell over". It's reference will be cleaned up and the
-    reference count will be decremented.
-
-    Reference counts are calculated by the length of the json structure
-    described above after process failures have been resolved.
+    A process may lock the resource through `Reference.lock`. By default the
+    lock raises phonon.exceptions.AlreadyLocked immediately if another process
+    holds it. With block=True it retries for up to Lock.TIMEOUT seconds
+    (defaults to 500s), backing off exponentially from Lock.BASE_RETRY up to
+    Lock.MAX_RETRY seconds with random jitter so contending processes don't
+    retry in lockstep.
+
+    Upon instantiation; `Reference` will set a field in the redis hash
+    "phonon_{0}.nodelist".format(resource) where the field is the unique id for
+    the connection this code is running on and the value is the unix timestamp
+    in milliseconds for the time the connection last refreshed that entry. If a
+    connection is in that hash it is assumed they currently have an active
+    session for the resource. If the entry was refreshed longer ago than the
+    session length it is assumed the process "fell over" and the entry will be
+    cleaned up.
+
+    Reference counts are kept in the integer "phonon_{0}.refcount".format(resource),
+    incremented and decremented atomically by redis. Neither structure is
+    serialized client side.
 
     """
 
-    def __init__(self, resource):
+    __slots__ = ('conn', 'resource_key', 'nodelist', 'times_modified_key', 'refcount_key', 'force_expiry')
+
+    def __init__(self, resource, pipeline=None):
         """
-        :param Process process: The Process to which this reference belongs
+        Refreshes this node's session in the nodelist. Expired nodes are not
+        pruned here; that happens on refresh_session and dereference.
+
         :param str resource: An identifier for the resource. For example:
             Buzz.12345
+        :param phonon.client.ShardedPipeline pipeline: optional, a pipeline to
+            queue the initialization commands on. The caller is responsible
+            for executing it. Otherwise they're sent in a pipeline of their
+            own.
 
         """
+        self.conn = phonon.connections.connection
+        execute = pipeline is None
+        if execute:
+            pipeline = self.conn.client.pipeline()
+
         self.resource_key = resource
-        self.nodelist = phonon.nodelist.Nodelist(resource)
+        self.nodelist = phonon.nodelist.Nodelist(resource, pipeline=pipeline)
         self.times_modified_key = "{}_{}.times_modified".format(PHONON_NAMESPACE, resource)
         self.refcount_key = "{}_{}.refcount".format(PHONON_NAMESPACE, resource)
         self.force_expiry = False
-        self.conn = phonon.connections.connection
-        if self.resource_key not in self.conn.local_registry:
-            self.conn.client.incr(self.refcount_key)
-            self.conn.add_to_registry(self.resource_key)
-
-        self.refresh_session()
-
-    def lock(self):
+        counted = self.resource_key not in self.conn.local_registry
+        if counted:
+            pipeline.incr(self.refcount_key)
+            self.conn.add_to_registry(self.resource_key, pipeline=pipeline)
+
+        if execute:
+            try:
+                pipeline.execute()
+            except Exception:
+                # The INCR may never have reached the server; count it again next time.
+                if counted:
+                    self.conn.local_registry.discard(self.resource_key)
+                raise
+
+    def lock(self, block=False):
         """
         Locks the resource managed by this reference.
+
+        :param bool block: Whether to retry until the lock is acquired rather
+            than raising AlreadyLocked immediately.
         """
-        return phonon.lock.Lock(self.resource_key)
+        return phonon.lock.Lock(self.resource_key, block=block)
 
     def refresh_session(self):
         """
-        Update the session for this node. Specifically; lock on the reflist,
-        then update the time  this node acquired the reference.
-
-        This method should only be called while the reference is locked.
+        Update the session for this node. Specifically; remove expired nodes
+        from the nodelist, then update the time this node acquired the
+        reference. Both happen atomically on the server in one round trip.
         """
-        expired_nodes = self.nodelist.find_expired_nodes()
-        if expired_nodes:
-            self.nodelist.remove_expired_nodes(expired_nodes)
-        self.nodelist.refresh_session()
+        self.nodelist.refresh_session_and_remove_expired_nodes()
 
     def increment_times_modified(self):
         """
         Increments the number of times this resource has been modified by all
         processes.
         """
-        rc = self.conn.client.incr(self.times_modified_key)
-        self.conn.client.pexpire(self.times_modified_key,
-                                 phonon.s_to_ms(TTL))  # ttl is in ms
+        pipeline = self.conn.client.pipeline()
+        pipeline.incr(self.times_modified_key)
+        pipeline.pexpire(self.times_modified_key, phonon.s_to_ms(TTL))  # ttl is in ms
+        pipeline.execute()
 
     def get_times_modified(self):
         """
@@ -150,8 +166,7 @@ class Reference(object):
             should_execute = True
 
         if not should_execute:
-            self.nodelist.remove_node(self.conn.id)
-            self.nodelist.remove_expired_nodes()
+            self.nodelist.remove_node_and_expired_nodes(self.conn.id)
 
             updated_refcount = client.incr(self.refcount_key, -1)
             should_execute = (updated_refcount <= 0)  # When we force expiry this will be -1
@@ -160,11 +175,36 @@ class Reference(object):
             if callable(callback) and should_execute:
                 callback(*args, **kwargs)
         finally:
+            pipeline = client.pipeline()
             if should_execute:
-                client.delete(self.resource_key,
-                              self.nodelist.nodelist_key,
-                              self.times_modified_key,
-                              self.refcount_key)
+                # One DEL per key; the pipeline routes each command by its first key.
+                for key in (self.resource_key, self.nodelist.nodelist_key,
+                            self.times_modified_key, self.refcount_key):
+                    pipeline.delete(key)
 
-            self.conn.remove_from_registry(self.resource_key)
+            self.conn.remove_from_registry(self.resource_key, pipeline=pipeline)
+            pipeline.execute()
         return should_execute
+
+
+def create_references(resources):
+    """
+    Creates a Reference to each resource, sending all of their
+    initialization commands in a single pipeline rather than several round
+    trips per reference.
+
+    :param list resources: Identifiers for the resources.
+
+    :rtype: list(Reference)
+    :returns: A Reference for each resource, in order.
+    """
+    conn = phonon.connections.connection
+    uncounted = set(resources) - conn.local_registry
+    pipeline = conn.client.pipeline()
+    references = [Reference(resource, pipeline=pipeline) for resource in resources]
+    try:
+        pipeline.execute()
+    except Exception:
+        conn.local_registry -= uncounted
+        raise
+    return references
@@ -1,30 +1,52 @@
-import sys
 import collections
 import tornado
 
+import phonon.exceptions
+
 
 class Registry(object):
 
     def __init__(self, max_entries=10000, ioloop=None):
+        if max_entries < 1:
+            raise phonon.exceptions.ArgumentError("max_entries must be at least 1")
         self.models = collections.OrderedDict()
         self.timeouts = {}
+        self.expiry_args = {}
         self.ioloop = ioloop or tornado.ioloop.IOLoop.current()
         self.max_entries = max_entries
 
     def register(self, model, *args, **kwargs):
-        if model.registry_key() in self.models:
-            self.models[model.registry_key()].merge(model)
-            self.ioloop.remove_timeout(self.timeouts[model.registry_key()])
+        key = model.registry_key()
+        registered = self.models.get(key)
+        if registered is not None:
+            registered.merge(model)
+            self.ioloop.remove_timeout(self.timeouts[key])
+            # Its timeout restarts, so it's now the most recently used model.
+            self.models[key] = self.models.pop(key)
         else:
-            self.models[model.registry_key()] = model
+            if len(self.models) >= self.max_entries:
+                self.expire_oldest()
+            registered = self.models[key] = model
 
-        self.timeouts[model.registry_key()] = self.ioloop.add_timeout(
-            model.TTL, self.on_expire, model, *args, **kwargs
+        self.expiry_args[key] = (args, kwargs)
+        self.timeouts[key] = self.ioloop.call_later(
+            registered.TTL, self.on_expire, registered, *args, **kwargs
         )
 
+    def expire_oldest(self):
+        """
+        Expires the least recently registered model immediately rather than waiting on its TTL, making room for another.
+        """
+        key = next(iter(self.models))
+        args, kwargs = self.expiry_args[key]
+        self.ioloop.remove_timeout(self.timeouts[key])
+        self.on_expire(self.models[key], *args, **kwargs)
+
     def on_expire(self, model, *args, **kwargs):
-        del self.models[model.registry_key()]
-        del self.timeouts[model.registry_key()]
+        key = model.registry_key()
+        del self.models[key]
+        del self.timeouts[key]
+        del self.expiry_args[key]
 
         if not model.reference.dereference(callback=model.on_complete,
                                            args=args,
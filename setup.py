@@ -17,7 +17,6 @@ setup(
     test_suite='test',
     install_requires=[
         'redis==2.10.5',
-        'pytz==2014.10',
         'tornado==4.3',
     ],
     tests_require=[
@@ -50,3 +50,27 @@ class ModelTest(unittest.TestCase):
 
         cached_value = self.conn.client.get('BizBar.1.a')
         assert cached_value == '5', cached_value
+
+    def test_cache_raises_cache_error(self):
+        class BizBar(phonon.model.Model):
+            id = phonon.fields.ID()
+            a = phonon.fields.Sum()
+        a = BizBar(id=1, a=5)
+        self.conn.client.rpush('BizBar.1.a', 'not a number')
+
+        with self.assertRaisesRegexp(phonon.exceptions.CacheError, "Failed to cache a"):
+            a.cache()
+
+    def test_init_requires_id(self):
+        class BizBar(phonon.model.Model):
+            pass
+
+        with self.assertRaises(phonon.exceptions.ArgumentError):
+            BizBar()
+
+    def test_on_complete_not_implemented(self):
+        class BizBar(phonon.model.Model):
+            pass
+
+        with self.assertRaises(phonon.exceptions.NotImplementedError):
+            BizBar(id=1).on_complete()
@@ -102,3 +102,46 @@ class NodelistTest(unittest.TestCase):
         nodes = nodelist.clear_nodelist()
         nodes = nodelist.get_all_nodes()
         assert nodes == {}
+
+    def test_refresh_session_and_remove_expired_nodes(self):
+        now = int(time.time() * 1000.)
+        expired = now - s_to_ms(2 * TTL + 1)
+
+        nodelist = Nodelist('key')
+
+        self.conn.client.hset(nodelist.nodelist_key, '1', now)
+        self.conn.client.hset(nodelist.nodelist_key, '2', expired)
+
+        count = nodelist.refresh_session_and_remove_expired_nodes('3')
+        nodes = nodelist.get_all_nodes()
+        assert count == 3, nodes
+        assert '1' in nodes
+        assert '2' not in nodes
+        assert '3' in nodes
+        assert self.conn.id in nodes
+
+    def test_remove_node_and_expired_nodes(self):
+        now = int(time.time() * 1000.)
+        expired = now - s_to_ms(2 * TTL + 1)
+
+        nodelist = Nodelist('key')
+
+        self.conn.client.hset(nodelist.nodelist_key, '1', now)
+        self.conn.client.hset(nodelist.nodelist_key, '2', expired)
+
+        count = nodelist.remove_node_and_expired_nodes()
+        nodes = nodelist.get_all_nodes()
+        assert count == 1, nodes
+        assert nodes.keys() == ['1'], nodes
+
+    def test_find_expired_nodes_ignores_removed_nodes(self):
+        now = int(time.time() * 1000.)
+        expired = now - s_to_ms(2 * TTL + 1)
+
+        nodelist = Nodelist('key')
+
+        self.conn.client.hset(nodelist.nodelist_key, '1', expired)
+        self.conn.client.hset(nodelist.nodelist_key, '2', expired)
+        nodelist.remove_node('1')
+
+        assert nodelist.find_expired_nodes(['1', '2']) == ['2']
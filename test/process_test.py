@@ -125,6 +125,14 @@ class ProcessTest(unittest.TestCase):
         finally:
             phonon.connections.AsyncConn.HEARTBEAT_INTERVAL = 30
 
+    def test_close_is_idempotent(self):
+        conn = phonon.connections.AsyncConn(redis_hosts=['localhost'])
+        with mock.patch.object(conn.client, 'hdel') as hdel:
+            conn.close()
+            conn.close()
+
+        assert hdel.call_count == 1
+
     def test_process_registry_tracks_references(self):
         conn = phonon.connections.connect(hosts=['localhost'])
         ref = phonon.reference.Reference("foo")
@@ -144,6 +152,64 @@ class ProcessTest(unittest.TestCase):
                 with phonon.lock.Lock("foo") as lock2:
                     pass
 
+    def test_lock_release_keeps_foreign_lock(self):
+        conn = phonon.connections.connect(hosts=['localhost'])
+        lock = phonon.lock.Lock("foo")
+        with lock:
+            conn.client.set(lock.lock_key, "someone else")
+
+        assert conn.client.get(lock.lock_key) == "someone else"
+
+    def test_lock_expires_after_ttl(self):
+        conn = phonon.connections.connect(hosts=['localhost'])
+        lock = phonon.lock.Lock("foo")
+        with lock:
+            ttl = conn.client.pttl(lock.lock_key)
+
+        assert phonon.s_to_ms(phonon.TTL) - 1000 < ttl <= phonon.s_to_ms(phonon.TTL), ttl
+
+    def test_blocking_lock_waits_for_release(self):
+        conn = phonon.connections.connect(hosts=['localhost'])
+        lock = phonon.lock.Lock("foo", block=True, timeout=1)
+        conn.client.set(lock.lock_key, "someone else", px=50)
+
+        with lock:
+            assert conn.client.get(lock.lock_key) == conn.id
+
+    def test_blocking_lock_times_out(self):
+        conn = phonon.connections.connect(hosts=['localhost'])
+        lock = phonon.lock.Lock("foo", block=True, timeout=0.05)
+        conn.client.set(lock.lock_key, "someone else")
+
+        with self.assertRaisesRegexp(phonon.exceptions.AlreadyLocked, "Already locked"):
+            with lock:
+                pass
+
+    def test_lock_timeout_defaults_to_class_timeout(self):
+        phonon.connections.connect(hosts=['localhost'])
+
+        class ShortLock(phonon.lock.Lock):
+            TIMEOUT = 1
+
+        assert ShortLock("foo").timeout == 1
+        assert phonon.lock.Lock("foo", timeout=2).timeout == 2
+
+    def test_blocking_lock_times_out_after_long_wait(self):
+        conn = phonon.connections.connect(hosts=['localhost'])
+        lock = phonon.lock.Lock("foo", block=True, timeout=700)
+        conn.client.set(lock.lock_key, "someone else")
+        clock = [0.]
+
+        def sleep(seconds):
+            clock[0] += seconds
+
+        with mock.patch('phonon.lock.time') as fake_time:
+            fake_time.time.side_effect = lambda: clock[0]
+            fake_time.sleep.side_effect = sleep
+            with self.assertRaisesRegexp(phonon.exceptions.AlreadyLocked, "Already locked"):
+                with lock:
+                    pass
+
     def test_remove_from_registry(self):
         conn = phonon.connections.connect(hosts=['localhost'])
         assert len(conn.get_registry()) == 0
@@ -187,6 +253,23 @@ class ProcessTest(unittest.TestCase):
             phonon.connections.AsyncConn.HEARTBEAT_INTERVAL = 30
             conn1.close()
 
+    def test_move_n_to_new_registry(self):
+        conn = phonon.connections.AsyncConn(redis_hosts=['localhost'])
+        try:
+            old_registry = conn.get_registry_key("12345")
+            for member in ("r1", "r2", "r3"):
+                conn.add_to_registry(member, old_registry)
+
+            conn.move_n_to_new_registry(old_registry, conn.registry_key, 2)
+
+            moved = conn.get_registry()
+            remaining = conn.client.smembers(old_registry)
+            assert len(moved) == 2, moved
+            assert len(remaining) == 1, remaining
+            assert moved | remaining == set(["r1", "r2", "r3"])
+        finally:
+            conn.close()
+
     def test_process_self_recovery(self):
         try:
             phonon.connections.AsyncConn.HEARTBEAT_INTERVAL = 0.1
@@ -222,7 +305,7 @@ class ProcessTest(unittest.TestCase):
             original_id = conn1.id
             conn1.client.hset(conn1.HEARTBEAT_KEY, conn1.id, int(int(time.time()) - 6 * conn1.HEARTBEAT_INTERVAL))
 
-            conn1.id = unicode(uuid.uuid4())
+            conn1.id = uuid.uuid4().hex
             conn1.recover_failed_processes()
 
             assert original_id in conn1.client.hgetall(conn1.HEARTBEAT_KEY)
@@ -253,3 +336,34 @@ class ProcessTest(unittest.TestCase):
                 conn1.recover_failed_processes()
         finally:
             conn1.close()
+
+    def test_send_heartbeat_passes_failed_pids_to_recovery(self):
+        conn = phonon.connections.AsyncConn(redis_hosts=['localhost'])
+        try:
+            conn.client.hset(conn.HEARTBEAT_KEY, "12345", 0)
+            with mock.patch.object(conn, 'recover_failed_processes') as recover:
+                conn.send_heartbeat()
+
+            failed, active = recover.call_args[0]
+            assert failed == set(["12345"]), failed
+            assert active == set([conn.id]), active
+        finally:
+            conn.close()
+
+    def test_failed_processes_are_partitioned_across_active(self):
+        conn = phonon.connections.AsyncConn(redis_hosts=['localhost'])
+        try:
+            other = "0" * 32 if conn.id > "0" * 32 else "f" * 32
+            failed = ["12345", "12346"]
+            for failed_pid in failed:
+                conn.add_to_registry(failed_pid, conn.get_registry_key(failed_pid))
+
+            conn.recover_failed_processes(set(failed), set([conn.id, other]))
+
+            index = sorted([conn.id, other]).index(conn.id)
+            claimed = failed[index]
+            unclaimed = failed[1 - index]
+            assert conn.get_registry() == set([claimed]), conn.get_registry()
+            assert conn.client.smembers(conn.get_registry_key(unclaimed)) == set([unclaimed])
+        finally:
+            conn.close()
@@ -3,7 +3,9 @@ import collections
 import time
 import redis
 import threading
+import mock
 
+import phonon.client
 import phonon.connections
 import phonon.reference
 
@@ -209,6 +211,26 @@ class ReferenceTest(unittest.TestCase):
         assert conn.client.get(a.resource_key) is None, conn.client.get(a.resource_key)
         assert conn.client.get(a.times_modified_key) is None, conn.client.get(a.times_modified_key)
 
+    def test_dereference_cleans_up_across_shards(self):
+        conn = phonon.connections.AsyncConn(redis_hosts=['localhost', '127.0.0.1'])
+        # Point the second shard at its own database so a misrouted DEL can't reach its keys.
+        conn.client.clients[1] = redis.StrictRedis(host='localhost', db=2)
+        phonon.connections.connection = conn
+        try:
+            a = phonon.reference.Reference('foo')
+            a.increment_times_modified()
+            keys = [a.resource_key, a.nodelist.nodelist_key, a.times_modified_key, a.refcount_key]
+            conn.client.set(a.resource_key, 'cached')
+            assert len(set(conn.client.route(key) for key in keys)) == 2
+
+            assert a.dereference()
+            for key in keys:
+                assert not conn.client.route(key).exists(key), key
+        finally:
+            conn.close()
+            conn.client.clients[1].flushdb()
+            phonon.connections.connection = self.conn
+
     def test_dereference_handles_when_never_modified(self):
         a = phonon.reference.Reference('foo')
         pids = a.nodelist.get_all_nodes()
@@ -233,3 +255,29 @@ class ReferenceTest(unittest.TestCase):
         assert len(foo) == 1
         a.dereference(callback, args=('second',))
         assert len(foo) == 0
+
+    def test_create_references(self):
+        refs = phonon.reference.create_references(['foo', 'bar', 'foo'])
+
+        assert [ref.resource_key for ref in refs] == ['foo', 'bar', 'foo']
+        for ref in refs:
+            assert ref.count() == 1, ref.count()
+            assert self.conn.id in ref.nodelist.get_all_nodes()
+        assert self.conn.get_registry() == set(['foo', 'bar'])
+
+    def test_failed_init_flush_leaves_resource_uncounted(self):
+        with mock.patch.object(phonon.client.ShardedPipeline, 'execute', side_effect=redis.ConnectionError):
+            with self.assertRaises(redis.ConnectionError):
+                phonon.reference.Reference('foo')
+
+        assert 'foo' not in self.conn.local_registry
+        assert phonon.reference.Reference('foo').count() == 1
+
+    def test_failed_create_references_flush_leaves_resources_uncounted(self):
+        with mock.patch.object(phonon.client.ShardedPipeline, 'execute', side_effect=redis.ConnectionError):
+            with self.assertRaises(redis.ConnectionError):
+                phonon.reference.create_references(['foo', 'bar'])
+
+        assert self.conn.local_registry == set()
+        refs = phonon.reference.create_references(['foo', 'bar'])
+        assert [ref.count() for ref in refs] == [1, 1]
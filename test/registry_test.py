@@ -2,6 +2,8 @@ import unittest
 
 import tornado.ioloop
 
+import phonon.exceptions
+import phonon.fields
 import phonon.model
 import phonon.registry
 import phonon.connections
@@ -12,6 +14,13 @@ class TestRegistry(unittest.TestCase):
     def setUp(self):
         self.conn = phonon.connections.connect(hosts=['localhost'])
         self.conn.client.flushall()
+        self.ioloop = tornado.ioloop.IOLoop()
+        self.ioloop.make_current()
+        phonon.registry.configure()
+
+    def tearDown(self):
+        self.ioloop.clear_current()
+        self.ioloop.close(all_fds=False)
 
     def test_registry_stores_new_models(self):
         class Bar(phonon.model.Model):
@@ -66,6 +75,62 @@ class TestRegistry(unittest.TestCase):
         tornado.ioloop.IOLoop.current().start()
         assert model.completed
 
+    def test_on_complete_gets_merged_model(self):
+        class MergeTest(phonon.model.Model):
+            TTL = 0.1
+            id = phonon.fields.ID()
+            a = phonon.fields.Sum()
+
+            def on_complete(self):
+                completed.append(self.a)
+                tornado.ioloop.IOLoop.current().stop()
+
+        completed = []
+        phonon.registry.register(MergeTest(id=1, a=1))
+        phonon.registry.register(MergeTest(id=1, a=2))
+        tornado.ioloop.IOLoop.current().start()
+        assert completed == [3], completed
+
+    def test_register_expires_oldest_when_full(self):
+        class Bar(phonon.model.Model):
+            def on_complete(self):
+                pass
+
+        phonon.registry.configure(max_entries=2)
+        phonon.registry.register(Bar(id=1))
+        phonon.registry.register(Bar(id=2))
+        phonon.registry.register(Bar(id=3))
+        assert phonon.registry.registry.models.keys() == ['Bar.2', 'Bar.3']
+        assert sorted(phonon.registry.registry.timeouts.keys()) == ['Bar.2', 'Bar.3']
+
+    def test_register_refreshes_recency_of_existing_model(self):
+        class Bar(phonon.model.Model):
+            def on_complete(self):
+                pass
+
+        phonon.registry.configure(max_entries=2)
+        phonon.registry.register(Bar(id=1))
+        phonon.registry.register(Bar(id=2))
+        phonon.registry.register(Bar(id=1))
+        phonon.registry.register(Bar(id=3))
+        assert phonon.registry.registry.models.keys() == ['Bar.1', 'Bar.3']
+
+    def test_expire_oldest_passes_registered_args(self):
+        class Bar(phonon.model.Model):
+            def on_complete(self, *args, **kwargs):
+                completed.append((self.id, args, kwargs))
+
+        completed = []
+        registry = phonon.registry.Registry(max_entries=1)
+        registry.register(Bar(id=1), 'a', b='c')
+        registry.register(Bar(id=2))
+        assert completed == [(1, ('a',), {'b': 'c'})], completed
+        assert registry.expiry_args.keys() == ['Bar.2']
+
+    def test_configure_rejects_empty_registry(self):
+        with self.assertRaises(phonon.exceptions.ArgumentError):
+            phonon.registry.configure(max_entries=0)
+
     def test_configure_sets_max_entries(self):
         phonon.registry.configure(max_entries=12)
         assert phonon.registry.registry.max_entries == 12
@@ -1,6 +1,8 @@
 import unittest
 import mock
+import redis
 
+import phonon.exceptions
 from phonon.client import ShardedClient
 
 
@@ -28,6 +30,14 @@ class TestShardedClient(unittest.TestCase):
         assert self.client.clients[0].get.called is True
         assert self.client.clients[1].get.called is True
 
+    def test_command_wrappers_are_cached(self):
+        get = self.client.get
+        assert 'get' in self.client.__dict__
+        assert self.client.get is get
+
+        self.client.no_such_command
+        assert 'no_such_command' not in self.client.__dict__
+
     def test_flushall_called_everywhere(self):
         for client in self.client.clients:
             client.flushall = mock.MagicMock()
@@ -51,3 +61,42 @@ class TestShardedClient(unittest.TestCase):
 
         for client in self.client.clients:
             assert client.flushdb.called is True
+
+    def test_register_script_routes_to_key(self):
+        for client in self.client.clients:
+            client.evalsha = mock.MagicMock(return_value=1)
+
+        script = self.client.register_script("return 1")
+        assert self.client.register_script("return 1") is script
+
+        script(keys=['4'], args=[])
+        assert self.client.clients[0].evalsha.called is True
+        assert self.client.clients[1].evalsha.called is False
+
+    def test_register_script_requires_keys(self):
+        script = self.client.register_script("return 1")
+        with self.assertRaises(phonon.exceptions.ArgumentError):
+            script(keys=[])
+
+    def test_pipeline_routes_and_orders_results(self):
+        pipelines = {}
+        for i, client in enumerate(self.client.clients):
+            pipelines[i] = mock.MagicMock()
+            pipelines[i].__len__.return_value = 1
+            pipelines[i].execute.return_value = [i]
+            client.pipeline = mock.MagicMock(return_value=pipelines[i])
+
+        pipeline = self.client.pipeline()
+        pipeline.get('1')
+        pipeline.get('4')
+
+        assert pipelines[0].get.called is True
+        assert pipelines[1].get.called is True
+        assert pipeline.execute() == [1, 0]
+
+    def test_clients_use_bounded_keepalive_pools(self):
+        for client in self.client.clients:
+            pool = client.connection_pool
+            assert isinstance(pool, redis.BlockingConnectionPool)
+            assert pool.max_connections == ShardedClient.MAX_CONNECTIONS
+            assert pool.connection_kwargs['socket_keepalive'] is True